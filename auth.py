@@ -1,22 +1,46 @@
 from fastapi import Request, HTTPException
 from databricks.sdk import WorkspaceClient
 from databricks.sdk.errors import PermissionDenied
-import os
-from dotenv import load_dotenv
+import functools
+import hashlib
+import threading
+import requests
+from cachetools import TTLCache
+import env_store
+from config import DATABRICKS_HOST as ENV_DATABRICKS_HOST, DATABRICKS_TOKEN as ENV_DATABRICKS_TOKEN
 
-# Load environment variables from .env file
-load_dotenv()
+# EC2 instance metadata service (IMDSv2)
+METADATA_URL = "http://169.254.169.254/latest"
+# (connect, read) timeouts so non-EC2 hosts fail fast
+METADATA_TIMEOUT = (0.2, 1.0)
+_metadata_session = requests.Session()
 
+def _get_metadata_hostname():
+    """Fetch the public hostname from the EC2 metadata service using IMDSv2"""
+    token_response = _metadata_session.put(
+        f"{METADATA_URL}/api/token",
+        headers={"X-aws-ec2-metadata-token-ttl-seconds": "21600"},
+        timeout=METADATA_TIMEOUT
+    )
+    token_response.raise_for_status()
+    
+    host_response = _metadata_session.get(
+        f"{METADATA_URL}/meta-data/public-hostname",
+        headers={"X-aws-ec2-metadata-token": token_response.text},
+        timeout=METADATA_TIMEOUT
+    )
+    host_response.raise_for_status()
+    return host_response.text
+
+@functools.lru_cache(maxsize=1)
 def get_databricks_host():
     try:
         # First try to get from .env file
-        env_host = os.getenv("DATABRICKS_HOST")
-        if env_host:
-            return env_host
+        if ENV_DATABRICKS_HOST:
+            return ENV_DATABRICKS_HOST
             
         # Then try to get from metadata API
-        from requests import get
-        host = get("http://169.254.169.254/latest/meta-data/public-hostname", timeout=2).text
+        host = _get_metadata_hostname()
         if host:
             host_url = "https://" + host
             # Save the detected host to .env file
@@ -25,41 +49,32 @@ def get_databricks_host():
         return None
     except:
         default_host = "https://<your-workspace>.cloud.databricks.com"
-        return os.getenv("DATABRICKS_HOST", default_host)
+        return ENV_DATABRICKS_HOST or default_host
 
 def save_host_to_env(host_url):
     """Save the detected host URL to .env file"""
     if not host_url:
         return
     
-    # Read current .env file
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    env_vars = {}
-    
-    if os.path.exists(env_path):
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key] = value
-    
     # Only update if not already set
-    if "DATABRICKS_HOST" not in env_vars:
-        env_vars['DATABRICKS_HOST'] = host_url
-        
-        # Write back to .env file
-        with open(env_path, 'w') as f:
-            for key, value in env_vars.items():
-                f.write(f"{key}={value}\n")
-        
+    if env_store.set("DATABRICKS_HOST", host_url, overwrite=False):
         print(f"📝 Saved Databricks host to .env file: {host_url}")
 
 DATABRICKS_HOST = get_databricks_host()
 
+# Verified users keyed by SHA-256 of the token, so repeat requests skip the me() round-trip
+PAT_CACHE_TTL = 300
+_PAT_CACHE = TTLCache(maxsize=1024, ttl=PAT_CACHE_TTL)
+_pat_cache_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=128)
+def _client_for(token):
+    """Reuse one WorkspaceClient per token"""
+    return WorkspaceClient(host=DATABRICKS_HOST, token=token)
+
 def verify_pat(request: Request):
     # Try to get token from .env file first
-    env_token = os.getenv("DATABRICKS_TOKEN")
+    env_token = ENV_DATABRICKS_TOKEN
     
     # Then check Authorization header
     auth = request.headers.get("Authorization")
@@ -73,9 +88,17 @@ def verify_pat(request: Request):
     else:
         raise HTTPException(status_code=401, detail="Missing or invalid PAT")
         
+    key = hashlib.sha256(token.encode()).hexdigest()
+    with _pat_cache_lock:
+        user_name = _PAT_CACHE.get(key)
+    if user_name is not None:
+        return {"token": token, "user": user_name}
+        
     try:
-        w = WorkspaceClient(host=DATABRICKS_HOST, token=token)
+        w = _client_for(token)
         user = w.current_user.me()
+        with _pat_cache_lock:
+            _PAT_CACHE[key] = user.user_name
         return {"token": token, "user": user.user_name}
     except PermissionDenied:
         raise HTTPException(status_code=403, detail="Permission denied")
@@ -87,25 +110,6 @@ def save_token_to_env(token):
     if not token:
         return
     
-    # Read current .env file
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    env_vars = {}
-    
-    if os.path.exists(env_path):
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key] = value
-    
     # Only update if not already set
-    if "DATABRICKS_TOKEN" not in env_vars:
-        env_vars['DATABRICKS_TOKEN'] = token
-        
-        # Write back to .env file
-        with open(env_path, 'w') as f:
-            for key, value in env_vars.items():
-                f.write(f"{key}={value}\n")
-        
-        print(f"📝 Saved Databricks token to .env file")
\ No newline at end of file
+    if env_store.set("DATABRICKS_TOKEN", token, overwrite=False):
+        print(f"📝 Saved Databricks token to .env file")
@@ -1,17 +1,21 @@
 # cleartunnel.py
-import os
 import time
 import re
-from dotenv import load_dotenv
+import env_store
+from config import ENABLE_CLEARTUNNEL, CLEARTUNNEL_URL
 
-# Load environment variables
-load_dotenv()
+# Current public tunnel URL, updated only by save_tunnel_url
+_TUNNEL_URL = CLEARTUNNEL_URL
+
+def get_tunnel_url():
+    """Return the current public tunnel URL without re-reading the environment"""
+    return _TUNNEL_URL
 
 def start_tunnel(local_port=8000):
     print("🚇 Starting Cloudflare Tunnel...")
     
     # Check if ClearTunnel is enabled via environment variable
-    if os.getenv("ENABLE_CLEARTUNNEL", "true").lower() != "true":
+    if not ENABLE_CLEARTUNNEL:
         print("⚠️ Cloudflare Tunnel is disabled via ENABLE_CLEARTUNNEL flag")
         return None
     
@@ -27,12 +31,14 @@ def start_tunnel(local_port=8000):
         
         # Start the tunnel using pycloudflared
         # This will automatically download cloudflared binary if needed
-        public_url = try_cloudflare(port=local_port)
+        urls = try_cloudflare(port=local_port)
         
-        if not public_url:
+        if not urls:
             print("❌ Failed to establish Cloudflare Tunnel")
             return None
         
+        # pycloudflared returns a Urls tuple; keep just the public address
+        public_url = getattr(urls, "tunnel", urls)
         print(f"✅ Cloudflare Tunnel established: {public_url}")
         
         # Save the URL to .env file
@@ -45,27 +51,13 @@ def start_tunnel(local_port=8000):
 
 def save_tunnel_url(url):
     """Save the tunnel URL to .env file"""
+    global _TUNNEL_URL
     if not url:
         return
     
-    # Read current .env file
-    env_path = os.path.join(os.path.dirname(__file__), '.env')
-    env_vars = {}
-    
-    if os.path.exists(env_path):
-        with open(env_path, 'r') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    env_vars[key] = value
+    # Accept a raw pycloudflared Urls tuple as well as a plain address
+    _TUNNEL_URL = getattr(url, "tunnel", url)
     
     # Update or add CLEARTUNNEL_URL
-    env_vars['CLEARTUNNEL_URL'] = url
-    
-    # Write back to .env file
-    with open(env_path, 'w') as f:
-        for key, value in env_vars.items():
-            f.write(f"{key}={value}\n")
-    
-    print(f"📝 Saved tunnel URL to .env file")
+    if env_store.set("CLEARTUNNEL_URL", _TUNNEL_URL):
+        print(f"📝 Saved tunnel URL to .env file")
@@ -0,0 +1,23 @@
+# config.py
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file, once per process
+load_dotenv(override=False)
+
+# Databricks workspace and credentials
+DATABRICKS_HOST = os.getenv("DATABRICKS_HOST")
+DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
+
+# SQL endpoint identifiers
+DATABRICKS_WAREHOUSE_ID = os.getenv("DATABRICKS_WAREHOUSE_ID", "0")
+DATABRICKS_CLUSTER_ID = os.getenv("DATABRICKS_CLUSTER_ID", "0")
+DATABRICKS_ENDPOINT_ID = os.getenv("DATABRICKS_ENDPOINT_ID", "0")
+
+# Connection pool settings
+POOL_SIZE = int(os.getenv("DATABRICKS_POOL_SIZE", "25"))
+POOL_TIMEOUT = float(os.getenv("DATABRICKS_POOL_TIMEOUT", "30"))
+
+# ClearTunnel settings
+ENABLE_CLEARTUNNEL = os.getenv("ENABLE_CLEARTUNNEL", "true").lower() == "true"
+CLEARTUNNEL_URL = os.getenv("CLEARTUNNEL_URL") or None
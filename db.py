@@ -1,20 +1,53 @@
-import pandas as pd
-import os
-import time
+import pyarrow as pa
+import queue
+import threading
 import logging
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
 from databricks import sql
+from databricks.sql.exc import OperationalError, SessionAlreadyClosedError, CursorAlreadyClosedError
+from thrift.transport.TTransport import TTransportException
 from auth import DATABRICKS_HOST
+from config import (
+    DATABRICKS_TOKEN,
+    DATABRICKS_WAREHOUSE_ID,
+    DATABRICKS_CLUSTER_ID,
+    DATABRICKS_ENDPOINT_ID,
+    POOL_SIZE,
+    POOL_TIMEOUT,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
+# Connection arguments passed to every sql.connect(). These only tune the
+# connector's built-in HTTP retry policy (429/503, connection resets); each
+# connection still keeps its own keep-alive urllib3 pool. The connector clamps
+# _retry_delay_max to a minimum of 5 seconds.
+TRANSPORT_ARGS = {
+    "_retry_stop_after_attempts_count": 3,
+    "_retry_delay_min": 0.5,
+    "_retry_delay_max": 5.0,
+    "_retry_stop_after_attempts_duration": 30.0,
+    "user_agent_entry": "supabricks",
+}
 
-# Get Databricks connection details
-DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
+# Error message fragments that indicate the session was already gone before
+# the statement ran, so re-executing it cannot apply it twice
+_STALE_SESSION_MARKERS = (
+    "invalid sessionhandle",
+    "session is closed",
+)
+
+# Error message fragments that indicate a dead session or socket
+_DISCONNECT_MARKERS = (
+    "invalid sessionhandle",
+    "session is closed",
+    "connection closed",
+    "connection reset",
+    "broken pipe",
+)
 
 # Function to get a SQL connection
 def get_connection():
@@ -31,8 +64,9 @@ def get_connection():
         # Try to connect with SQL warehouse endpoint path
         connection = sql.connect(
             server_hostname=hostname,
-            http_path=f"/sql/1.0/warehouses/{os.getenv('DATABRICKS_WAREHOUSE_ID', '0')}",
-            access_token=DATABRICKS_TOKEN
+            http_path=f"/sql/1.0/warehouses/{DATABRICKS_WAREHOUSE_ID}",
+            access_token=DATABRICKS_TOKEN,
+            **TRANSPORT_ARGS
         )
         return connection
     except Exception as e:
@@ -47,8 +81,9 @@ def get_connection():
             
             connection = sql.connect(
                 server_hostname=hostname,
-                http_path=f"/sql/protocolv1/o/{workspace_id}/{os.getenv('DATABRICKS_CLUSTER_ID', '0')}",
-                access_token=DATABRICKS_TOKEN
+                http_path=f"/sql/protocolv1/o/{workspace_id}/{DATABRICKS_CLUSTER_ID}",
+                access_token=DATABRICKS_TOKEN,
+                **TRANSPORT_ARGS
             )
             return connection
         except Exception as e2:
@@ -60,175 +95,307 @@ def get_connection():
                 logger.info(f"Retrying connection with SQL endpoint path")
                 connection = sql.connect(
                     server_hostname=hostname,
-                    http_path=f"/sql/1.0/endpoints/{os.getenv('DATABRICKS_ENDPOINT_ID', '0')}",
-                    access_token=DATABRICKS_TOKEN
+                    http_path=f"/sql/1.0/endpoints/{DATABRICKS_ENDPOINT_ID}",
+                    access_token=DATABRICKS_TOKEN,
+                    **TRANSPORT_ARGS
                 )
                 return connection
             except Exception as e3:
                 logger.error(f"Error on third connection attempt: {e3}")
                 return None
 
+class ConnectionPool:
+    """Bounded pool of Databricks SQL connections shared across requests"""
+    def __init__(self, size=POOL_SIZE):
+        self.size = size
+        # Slots start empty (None) and are filled lazily on first use.
+        # LIFO so the most recently used (warmest) connection is handed out first.
+        self._queue = queue.LifoQueue(maxsize=size)
+        for _ in range(size):
+            self._queue.put(None)
+
+    def get(self, timeout=POOL_TIMEOUT):
+        """Check out a connection, opening one if the slot is empty"""
+        try:
+            conn = self._queue.get(timeout=timeout)
+        except queue.Empty:
+            raise Exception(f"Timed out waiting for a connection from the pool (size={self.size})")
+
+        if conn is None:
+            conn = get_connection()
+            if conn is None:
+                # Give the slot back so other callers are not starved
+                self._queue.put(None)
+                raise Exception("Failed to establish connection")
+        return conn
+
+    def put(self, conn):
+        """Return a healthy connection to the pool"""
+        self._queue.put(conn)
+
+    def discard(self, conn):
+        """Close a broken connection and free its slot for a fresh one"""
+        _close_quietly(conn)
+        self._queue.put(None)
+
+    def reconnect(self, conn):
+        """Replace a broken checked-out connection with a fresh one, keeping its slot"""
+        _close_quietly(conn)
+        new_conn = get_connection()
+        if new_conn is None:
+            self._queue.put(None)
+            raise Exception("Failed to establish connection")
+        return new_conn
+
+    def close(self):
+        """Drain the pool and close every open connection"""
+        while True:
+            try:
+                conn = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            _close_quietly(conn)
+
+def _close_quietly(obj):
+    """Close a connection or cursor, ignoring any error"""
+    try:
+        if obj is not None:
+            obj.close()
+    except:
+        pass
+
+def _is_disconnect(exc):
+    """Check whether an error means the connection itself is no longer usable"""
+    if isinstance(exc, (OperationalError, TTransportException)):
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in _DISCONNECT_MARKERS)
+
+def _is_stale_session(exc):
+    """Check whether a query failed because its session was dead before it ran
+
+    Only these errors are safe to re-execute. The connector raises RequestError
+    (an OperationalError) when a statement may already have reached the server,
+    so a bare OperationalError is never retried. TTransportException is not
+    retried either, since it can be raised while reading the response of a
+    statement the server already ran; _is_disconnect still discards the connection.
+    """
+    if isinstance(exc, (SessionAlreadyClosedError, CursorAlreadyClosedError)):
+        return True
+    message = str(exc).lower()
+    return any(marker in message for marker in _STALE_SESSION_MARKERS)
+
+def _fetch_arrow(cursor):
+    """Fetch all rows from an executed cursor as an Arrow table"""
+    if not cursor.description:
+        return pa.table({})
+
+    if hasattr(cursor, "fetchall_arrow"):
+        return cursor.fetchall_arrow()
+
+    # Older connectors only return Python rows
+    columns = [desc[0] for desc in cursor.description]
+    data = cursor.fetchall()
+    return pa.table({col: [row[i] for row in data] for i, col in enumerate(columns)})
+
 class SparkSession:
-    def __init__(self):
-        self.connection = None
-        self.cursor = None
-    
-    def _ensure_connection(self):
-        """Ensure we have an active connection and cursor"""
-        if self.connection is None:
-            self.connection = get_connection()
-            if self.connection:
-                self.cursor = self.connection.cursor()
-    
-    def sql(self, query, max_retries=3):
-        """Execute SQL query and return results as DataFrame"""
-        retries = 0
-        while retries < max_retries:
+    def __init__(self, pool):
+        self.pool = pool
+
+    def sql(self, query, params=None):
+        """Execute SQL query and return results as an Arrow table
+
+        Transient HTTP failures are retried by the transport. A query whose pooled
+        connection has gone stale is retried once on a fresh connection; any
+        other error is raised to the caller.
+
+        Args:
+            query: SQL text, using ? markers for bound parameters
+            params: Optional list of values bound to the ? markers
+        """
+        logger.info(f"Executing query: {query}")
+
+        # Check out a connection from the pool
+        conn = self.pool.get()
+        try:
             try:
-                logger.info(f"Executing query: {query}")
-                
-                # Ensure we have a connection
-                self._ensure_connection()
-                if not self.connection or not self.cursor:
-                    raise Exception("Failed to establish connection")
-                
-                # Execute query
-                self.cursor.execute(query)
-                
-                # Convert to pandas DataFrame
-                columns = [desc[0] for desc in self.cursor.description] if self.cursor.description else []
-                data = self.cursor.fetchall()
-                df = pd.DataFrame(data, columns=columns)
-                
-                logger.info(f"Query returned {len(df)} rows")
-                return df
+                table = self._execute(conn, query, params)
             except Exception as e:
-                retries += 1
-                logger.error(f"Error executing query (attempt {retries}/{max_retries}): {e}")
-                
-                # Close and reset connection on error
-                self._close_connection()
-                
-                if retries < max_retries:
-                    # Exponential backoff
-                    wait_time = 2 ** retries
-                    logger.info(f"Retrying in {wait_time} seconds...")
-                    time.sleep(wait_time)
+                if not _is_stale_session(e):
+                    raise
+                logger.warning(f"Stale connection, retrying once on a fresh one: {e}")
+                stale, conn = conn, None
+                conn = self.pool.reconnect(stale)
+                table = self._execute(conn, query, params)
+        except Exception as e:
+            logger.error(f"Error executing query: {e}")
+            if conn is not None:
+                # Stale connections are replaced, healthy ones go back to the pool
+                if _is_disconnect(e):
+                    self.pool.discard(conn)
                 else:
-                    logger.error(f"Max retries reached. Query failed: {query}")
-                    # Return empty DataFrame on error
-                    return pd.DataFrame()
-    
-    def _close_connection(self):
-        """Close the current connection and reset state"""
-        try:
-            if self.cursor:
-                self.cursor.close()
-        except:
-            pass
-        
+                    self.pool.put(conn)
+            raise
+
+        self.pool.put(conn)
+        logger.info(f"Query returned {table.num_rows} rows")
+        return table
+
+    def _execute(self, conn, query, params):
+        """Run a query on a connection and fetch the results as columnar Arrow data"""
+        cursor = conn.cursor()
         try:
-            if self.connection:
-                self.connection.close()
-        except:
-            pass
-            
-        self.connection = None
-        self.cursor = None
-    
+            # Execute query, letting the driver bind any parameters
+            cursor.execute(query, params)
+            return _fetch_arrow(cursor)
+        finally:
+            _close_quietly(cursor)
+
     def close(self):
-        """Close the connection"""
-        self._close_connection()
+        """Close all pooled connections"""
+        self.pool.close()
 
-# Create spark session
-spark = SparkSession()
+# Create connection pool and spark session
+pool = ConnectionPool()
+spark = SparkSession(pool)
 
 # Register cleanup on exit
 import atexit
 atexit.register(spark.close)
 
-def get_table_df(full_table_name):
-    """Get table data as DataFrame
+def get_table_arrow(full_table_name, limit=100):
+    """Get table data as an Arrow table
     
     Args:
         full_table_name: Full table name in format catalog.schema.table
+        limit: Maximum number of rows to return
     """
     try:
         logger.info(f"Getting data from table: {full_table_name}")
-        query = f"SELECT * FROM {full_table_name} LIMIT 100"
+        query = f"SELECT * FROM {full_table_name} LIMIT {int(limit)}"
         return spark.sql(query)
     except Exception as e:
         logger.error(f"Error getting table data: {e}")
-        return pd.DataFrame()
+        return pa.table({})
 
-def list_catalogs():
-    """List all available Unity Catalogs"""
+# The table listing is identical across users and only changes on DDL
+TABLES_CACHE_TTL = 60
+_tables_cache = TTLCache(maxsize=1, ttl=TABLES_CACHE_TTL)
+# Guards cache reads and writes only; it is never held while querying
+_tables_lock = threading.Lock()
+
+def list_catalogs(raise_errors=False):
+    """List all available Unity Catalogs
+
+    Errors are logged and an empty list returned unless raise_errors is set.
+    """
     try:
         logger.info("Listing catalogs")
-        df = spark.sql("SHOW CATALOGS")
-        catalogs = [row["catalog"] for _, row in df.iterrows()]
+        table = spark.sql("SHOW CATALOGS")
+        catalogs = table.column("catalog").to_pylist()
         logger.info(f"Found {len(catalogs)} catalogs: {catalogs}")
         return catalogs
     except Exception as e:
         logger.error(f"Error listing catalogs: {e}")
+        if raise_errors:
+            raise
         return []
 
-def list_schemas(catalog):
-    """List all schemas in a specific catalog"""
+def list_schemas(catalog, raise_errors=False):
+    """List all schemas in a specific catalog
+
+    Errors are logged and an empty list returned unless raise_errors is set.
+    """
     try:
         logger.info(f"Listing schemas in catalog: {catalog}")
         # Try different column names that might be returned
-        df = spark.sql(f"SHOW SCHEMAS IN {catalog}")
+        table = spark.sql(f"SHOW SCHEMAS IN {catalog}")
         
         # Check which column name is present in the result
-        if "namespace" in df.columns:
-            schemas = [row["namespace"] for _, row in df.iterrows()]
-        elif "schema" in df.columns:
-            schemas = [row["schema"] for _, row in df.iterrows()]
-        elif "databaseName" in df.columns:
-            schemas = [row["databaseName"] for _, row in df.iterrows()]
+        if "namespace" in table.column_names:
+            schemas = table.column("namespace").to_pylist()
+        elif "schema" in table.column_names:
+            schemas = table.column("schema").to_pylist()
+        elif "databaseName" in table.column_names:
+            schemas = table.column("databaseName").to_pylist()
         else:
             # If none of the expected columns are found, log the columns and return empty
-            logger.warning(f"Unexpected schema result columns: {df.columns.tolist()}")
+            logger.warning(f"Unexpected schema result columns: {table.column_names}")
             schemas = []
             
         logger.info(f"Found {len(schemas)} schemas in {catalog}: {schemas}")
         return schemas
     except Exception as e:
         logger.error(f"Error listing schemas in {catalog}: {e}")
+        if raise_errors:
+            raise
         return []
 
-def list_tables_in_schema(catalog, schema):
-    """List all tables in a specific schema"""
+def list_tables_in_schema(catalog, schema, raise_errors=False):
+    """List all tables in a specific schema
+
+    Errors are logged and an empty list returned unless raise_errors is set.
+    """
     try:
         logger.info(f"Listing tables in {catalog}.{schema}")
-        df = spark.sql(f"SHOW TABLES IN {catalog}.{schema}")
+        table = spark.sql(f"SHOW TABLES IN {catalog}.{schema}")
         
         # Check which column name is present in the result
-        if "tableName" in df.columns:
+        if "tableName" in table.column_names:
             table_name_col = "tableName"
-        elif "name" in df.columns:
+        elif "name" in table.column_names:
             table_name_col = "name"
         else:
             # If none of the expected columns are found, log the columns and return empty
-            logger.warning(f"Unexpected table result columns: {df.columns.tolist()}")
+            logger.warning(f"Unexpected table result columns: {table.column_names}")
             return []
             
         tables = [{
-            "name": row[table_name_col],
-            "full_name": f"{catalog}.{schema}.{row[table_name_col]}",
+            "name": name,
+            "full_name": f"{catalog}.{schema}.{name}",
             "catalog": catalog,
             "schema": schema
-        } for _, row in df.iterrows()]
+        } for name in table.column(table_name_col).to_pylist()]
         
         logger.info(f"Found {len(tables)} tables in {catalog}.{schema}")
         return tables
     except Exception as e:
         logger.error(f"Error listing tables in {catalog}.{schema}: {e}")
+        if raise_errors:
+            raise
         return []
 
-def list_all_tables():
-    """List all tables across all catalogs and schemas using a more efficient approach"""
+def get_cached_tables():
+    """Return the cached table listing, or None if it has expired"""
+    with _tables_lock:
+        return _tables_cache.get("tables")
+
+def refresh_all_tables():
+    """Query all tables and cache the result for TABLES_CACHE_TTL seconds
+
+    Callers are responsible for not running this concurrently (see main.list_tables).
+    """
+    tables, complete = _query_all_tables()
+    # Don't cache failures or partial listings
+    if tables and complete:
+        with _tables_lock:
+            _tables_cache["tables"] = tables
+    return tables
+
+def list_all_tables(refresh=False):
+    """List all tables across all catalogs and schemas, using the cache unless refresh is set"""
+    if not refresh:
+        tables = get_cached_tables()
+        if tables is not None:
+            logger.info(f"Returning {len(tables)} cached tables")
+            return tables
+    return refresh_all_tables()
+
+def _query_all_tables():
+    """List all tables across all catalogs and schemas using a more efficient approach
+
+    Returns (tables, complete) where complete is False if any sub-query failed.
+    """
     try:
         logger.info("Listing all tables using a single query approach")
         
@@ -245,49 +412,120 @@ def list_all_tables():
         AND table_catalog NOT IN ('information_schema', 'system')
         """
         
-        df = spark.sql(query)
+        table = spark.sql(query)
         
-        if df.empty:
+        if table.num_rows == 0:
             logger.warning("No tables found or information_schema query failed, falling back to recursive method")
             return _list_all_tables_recursive(exclude_system=True)
         
-        # Convert DataFrame to list of dictionaries
-        tables = df.to_dict(orient="records")
+        # Convert Arrow table to list of dictionaries
+        tables = table.to_pylist()
         logger.info(f"Found a total of {len(tables)} tables using information_schema")
-        return tables
+        return tables, True
     except Exception as e:
         logger.error(f"Error listing all tables with information_schema: {e}")
         logger.info("Falling back to recursive method")
         return _list_all_tables_recursive(exclude_system=True)
 
+def _is_system(name):
+    """Check whether a catalog or schema name is a system one"""
+    return name.startswith('sys') or name in ['information_schema', 'system']
+
+def _list_tables_in_catalog(catalog, exclude_system=True):
+    """List all tables in a catalog with a single information_schema query
+
+    Returns None only if the query fails, so the caller can fall back to walking
+    the catalog schema by schema; a catalog with no tables returns [].
+    """
+    try:
+        logger.info(f"Listing tables in {catalog} using information_schema")
+        # Unity Catalog reports MANAGED/EXTERNAL/etc. rather than 'BASE TABLE',
+        # so exclude views instead of matching a single table type
+        table = spark.sql(f"""SELECT 
+            table_schema as schema, 
+            table_name as name
+        FROM {catalog}.information_schema.tables
+        WHERE table_type NOT IN ('VIEW', 'MATERIALIZED_VIEW')
+        """)
+        
+        schemas = table.column("schema").to_pylist()
+        names = table.column("name").to_pylist()
+        tables = [{
+            "catalog": catalog,
+            "schema": schema,
+            "name": name,
+            "full_name": f"{catalog}.{schema}.{name}"
+        } for schema, name in zip(schemas, names)
+            if not (exclude_system and _is_system(schema))]
+        
+        logger.info(f"Found {len(tables)} tables in {catalog}")
+        return tables
+    except Exception as e:
+        logger.error(f"Error listing tables in {catalog} with information_schema: {e}")
+        return None
+
 def _list_all_tables_recursive(exclude_system=True):
-    """List all tables across all catalogs and schemas using recursive approach (fallback)"""
+    """List all tables across all catalogs and schemas using recursive approach (fallback)
+
+    Each catalog is first listed with one information_schema query; only catalogs
+    where that fails are walked schema by schema. Catalogs and schemas are listed
+    in parallel, one pooled connection per worker.
+
+    Returns (tables, complete) where complete is False if any sub-query failed.
+    """
     all_tables = []
+    failures = []
+    
+    def attempt(func, *args):
+        """Run a listing call, recording a failure instead of raising"""
+        try:
+            return func(*args, raise_errors=True)
+        except Exception:
+            failures.append(args)
+            return []
+    
     try:
         logger.info("Starting to list all tables recursively across all catalogs and schemas")
-        catalogs = list_catalogs()
+        catalogs = list_catalogs(raise_errors=True)
         
-        for catalog in catalogs:
-            # Skip system catalogs
-            if exclude_system and (catalog.startswith('sys') or catalog in ['information_schema', 'system']):
-                logger.info(f"Skipping system catalog: {catalog}")
-                continue
-                
-            logger.info(f"Processing catalog: {catalog}")
-            schemas = list_schemas(catalog)
+        # Skip system catalogs
+        if exclude_system:
+            skipped = [c for c in catalogs if _is_system(c)]
+            if skipped:
+                logger.info(f"Skipping system catalogs: {skipped}")
+            catalogs = [c for c in catalogs if not _is_system(c)]
+        
+        # Executor width matches the pool so workers never wait on a connection
+        with ThreadPoolExecutor(max_workers=POOL_SIZE) as executor:
+            catalog_tables = executor.map(lambda c: _list_tables_in_catalog(c, exclude_system), catalogs)
             
-            for schema in schemas:
-                # Skip system schemas
-                if exclude_system and (schema.startswith('sys') or schema in ['information_schema', 'system']):
-                    logger.info(f"Skipping system schema: {catalog}.{schema}")
-                    continue
-                    
-                logger.info(f"Processing schema: {catalog}.{schema}")
-                tables = list_tables_in_schema(catalog, schema)
+            remaining = []
+            for catalog, tables in zip(catalogs, catalog_tables):
+                if tables is None:
+                    remaining.append(catalog)
+                else:
+                    all_tables.extend(tables)
+            
+            if remaining:
+                logger.info(f"Walking schemas for catalogs where information_schema failed: {remaining}")
+            schemas_by_catalog = dict(zip(remaining, executor.map(lambda c: attempt(list_schemas, c), remaining)))
+            
+            pairs = []
+            for catalog, schemas in schemas_by_catalog.items():
+                for schema in schemas:
+                    # Skip system schemas
+                    if exclude_system and _is_system(schema):
+                        logger.info(f"Skipping system schema: {catalog}.{schema}")
+                        continue
+                    pairs.append((catalog, schema))
+            
+            for tables in executor.map(lambda pair: attempt(list_tables_in_schema, *pair), pairs):
                 all_tables.extend(tables)
                 
+        if failures:
+            logger.warning(f"Table listing is incomplete, {len(failures)} sub-queries failed: {failures}")
         logger.info(f"Found a total of {len(all_tables)} tables recursively")
-        return all_tables
+        return all_tables, not failures
     except Exception as e:
         logger.error(f"Error listing all tables recursively: {e}")
-        return []
+        return [], False
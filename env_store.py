@@ -0,0 +1,74 @@
+# env_store.py
+import os
+import re
+import atexit
+import threading
+
+# Path to the .env file next to the application
+ENV_PATH = os.path.join(os.path.dirname(__file__), '.env')
+
+# KEY=value lines, optionally indented, exported or spaced around "=" as
+# python-dotenv allows; comments and anything else are skipped
+_LINE_RE = re.compile(r"^\s*(?:export\s+)?([A-Za-z_]\w*)\s*=\s*(.*)$")
+
+# Seconds to wait after the last change before writing to disk
+FLUSH_DELAY = 2.0
+
+_CACHE = {}
+_dirty = False
+_timer = None
+_lock = threading.Lock()
+
+def _load():
+    """Read the .env file into the in-memory cache"""
+    if not os.path.exists(ENV_PATH):
+        return
+
+    with open(ENV_PATH, 'r') as f:
+        match = _LINE_RE.match
+        for line in f:
+            m = match(line)
+            if m:
+                _CACHE[m.group(1)] = m.group(2).rstrip()
+
+def get(key, default=None):
+    """Get a value from the cached .env contents"""
+    return _CACHE.get(key, default)
+
+def set(key, value, overwrite=True):
+    """Set a value in the cache and schedule a write to disk if it changed
+
+    Returns True if the stored value changed.
+    """
+    global _dirty, _timer
+    with _lock:
+        if key in _CACHE and (not overwrite or _CACHE[key] == value):
+            return False
+
+        _CACHE[key] = value
+        _dirty = True
+
+        # Debounce: restart the timer so bursts of changes produce one write
+        if _timer is not None:
+            _timer.cancel()
+        _timer = threading.Timer(FLUSH_DELAY, flush)
+        _timer.daemon = True
+        _timer.start()
+        return True
+
+def flush():
+    """Write the cache back to the .env file if anything changed"""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+
+        with open(ENV_PATH, 'w') as f:
+            for key, value in _CACHE.items():
+                f.write(f"{key}={value}\n")
+        _dirty = False
+
+_load()
+
+# Make sure pending changes reach disk on shutdown
+atexit.register(flush)
@@ -1,17 +1,30 @@
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response, StreamingResponse
 from auth import verify_pat, DATABRICKS_HOST
-from db import spark, get_table_df, list_all_tables
+from db import spark, get_table_arrow, get_cached_tables, refresh_all_tables
 from models import InsertPayload, UpdatePayload, DeletePayload, CreateTablePayload
-from utils import apply_filter, dict_to_sql_filter
-import pandas as pd
+from utils import apply_filter, dict_to_sql_filter, rows_to_json, arrow_to_ndjson
+import anyio.to_thread
+import asyncio
+import functools
 import threading
 import time
-import os
-from cleartunnel import start_tunnel
-from dotenv import load_dotenv
+from cleartunnel import start_tunnel, get_tunnel_url
+from config import ENABLE_CLEARTUNNEL, POOL_SIZE
 
-# Load environment variables
-load_dotenv()
+# Row reads returning more rows than this are streamed as NDJSON instead of one JSON array
+STREAM_ROWS_THRESHOLD = 10_000
+
+# Largest row limit a read may request. Results are fully fetched before they
+# are serialized, so this cap is what bounds memory per request.
+MAX_ROWS_LIMIT = 100_000
+
+# Blocking Databricks calls run in worker threads, at most one per pooled connection
+_DB_LIMITER = anyio.CapacityLimiter(POOL_SIZE)
+
+async def run_db(func, *args, **kwargs):
+    """Run a blocking Databricks call in a worker thread without blocking the event loop"""
+    return await anyio.to_thread.run_sync(functools.partial(func, *args, **kwargs), limiter=_DB_LIMITER)
 
 app = FastAPI(
     title="Supabricks",
@@ -35,7 +48,7 @@ def startup_event():
     print(f"🧠 Supabricks started. Detected host: {DATABRICKS_HOST}")
     
     # Start ClearTunnel if enabled
-    if os.getenv("ENABLE_CLEARTUNNEL", "true").lower() == "true":
+    if ENABLE_CLEARTUNNEL:
         tunnel_url = start_tunnel(8000)
         if tunnel_url:
             print(f"🌐 API accessible via: {tunnel_url}")
@@ -43,7 +56,7 @@ def startup_event():
 @app.middleware("http")
 async def auth_pat_middleware(request: Request, call_next):
     if request.url.path.startswith("/tables"):
-        user_info = verify_pat(request)
+        user_info = await anyio.to_thread.run_sync(verify_pat, request)
         request.state.user = user_info
     return await call_next(request)
 
@@ -51,7 +64,7 @@ async def auth_pat_middleware(request: Request, call_next):
     summary="API Root",
     description="Returns basic information about the Supabricks API including version and available endpoints.")
 def root():
-    tunnel_url = os.getenv("CLEARTUNNEL_URL", None)
+    tunnel_url = get_tunnel_url()
     return {
         "app": "Supabricks",
         "version": "3.2",
@@ -60,50 +73,82 @@ def root():
         "public_url": tunnel_url
     }
 
+# Table listing currently being fetched, shared by concurrent /tables requests
+_tables_inflight = None
+
+def _clear_tables_inflight(future):
+    global _tables_inflight
+    if _tables_inflight is future:
+        _tables_inflight = None
+    # Mark the exception as retrieved if every waiter went away
+    if not future.cancelled():
+        future.exception()
+
 @app.get("/tables", 
     summary="List All Tables",
-    description="Returns a list of all tables accessible to the authenticated user across all catalogs and schemas.")
-def list_tables():
-    return list_all_tables()
+    description="Returns a list of all tables accessible to the authenticated user across all catalogs and schemas. Results are cached for 60 seconds; pass refresh=true to bypass the cache.")
+async def list_tables(refresh: bool = False):
+    global _tables_inflight
+    if not refresh:
+        tables = get_cached_tables()
+        if tables is not None:
+            return tables
+    
+    # Singleflight: only the first caller queries Databricks (taking a DB limiter
+    # slot); concurrent callers await the same future without holding a slot
+    if _tables_inflight is None:
+        _tables_inflight = asyncio.ensure_future(run_db(refresh_all_tables))
+        _tables_inflight.add_done_callback(_clear_tables_inflight)
+    # Shield so a disconnecting client doesn't cancel the listing for everyone else
+    return await asyncio.shield(_tables_inflight)
 
 @app.get("/tables/{full_table_name}", 
     summary="Query Table Rows",
-    description="Retrieves rows from the specified table. The table name should be in the format 'catalog.schema.table'.")
-def get_rows(full_table_name: str, limit: int = 100):
-    df = get_table_df(full_table_name)
-    if df.empty:
+    description="Retrieves rows from the specified table. The table name should be in the format 'catalog.schema.table'. Results with more than 10,000 rows are streamed as newline-delimited JSON; the maximum limit is 100,000.")
+async def get_rows(full_table_name: str, limit: int = 100):
+    if limit < 1 or limit > MAX_ROWS_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {MAX_ROWS_LIMIT}")
+    table = await run_db(get_table_arrow, full_table_name, limit)
+    if table.num_rows == 0:
         raise HTTPException(status_code=404, detail="Table not found or empty")
-    return df.head(limit).to_dict(orient="records")
+    if table.num_rows > STREAM_ROWS_THRESHOLD:
+        return StreamingResponse(arrow_to_ndjson(table), media_type="application/x-ndjson")
+    # Serialization is CPU-bound, so keep it off the event loop
+    content = await anyio.to_thread.run_sync(lambda: rows_to_json(table.to_pylist()))
+    return Response(content, media_type="application/json")
 
 @app.post("/tables/{full_table_name}", 
     summary="Insert Rows",
     description="Inserts new rows into the specified table. Provide data as an array of objects where each object represents a row.")
-def insert_rows(full_table_name: str, payload: InsertPayload):
-    df = pd.DataFrame(payload.data)
+async def insert_rows(full_table_name: str, payload: InsertPayload):
     try:
-        # Convert DataFrame to SQL insert statements
-        columns = ", ".join(df.columns)
-        values_list = []
-        for _, row in df.iterrows():
-            values = ", ".join([f"'{str(val)}'" if val is not None else "NULL" for val in row])
-            values_list.append(f"({values})")
+        # Union of keys across all rows, in first-seen order; missing values insert as NULL
+        columns = list(dict.fromkeys(k for row in payload.data for k in row))
+        if not columns:
+            raise HTTPException(status_code=400, detail="No columns to insert")
+        
+        column_list = ", ".join(columns)
         
-        values_str = ", ".join(values_list)
-        query = f"INSERT INTO {full_table_name} ({columns}) VALUES {values_str}"
-        spark.sql(query)
+        # Bind values as parameters in a single statement, so the insert is all-or-nothing
+        placeholders = "(" + ", ".join(["?"] * len(columns)) + ")"
+        params = [row.get(col) for row in payload.data for col in columns]
+        query = f"INSERT INTO {full_table_name} ({column_list}) VALUES {', '.join([placeholders] * len(payload.data))}"
+        await run_db(spark.sql, query, params)
         return {"status": "inserted", "rows": len(payload.data)}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.put("/tables/{full_table_name}", 
     summary="Update Rows",
     description="Updates rows in the specified table that match the filter criteria. Provide filter conditions and the values to update.")
-def update_rows(full_table_name: str, payload: UpdatePayload):
+async def update_rows(full_table_name: str, payload: UpdatePayload):
     try:
-        filter_expr = dict_to_sql_filter(payload.filter)
-        updates = ", ".join([f"{k} = '{v}'" for k, v in payload.updates.items()])
+        filter_expr, filter_params = dict_to_sql_filter(payload.filter)
+        updates = ", ".join([f"{k} = ?" for k in payload.updates])
         query = f"UPDATE {full_table_name} SET {updates} WHERE {filter_expr}"
-        spark.sql(query)
+        await run_db(spark.sql, query, list(payload.updates.values()) + filter_params)
         return {"status": "updated", "where": payload.filter}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -111,11 +156,11 @@ def update_rows(full_table_name: str, payload: UpdatePayload):
 @app.delete("/tables/{full_table_name}", 
     summary="Delete Rows",
     description="Deletes rows from the specified table that match the filter criteria.")
-def delete_rows(full_table_name: str, payload: DeletePayload):
+async def delete_rows(full_table_name: str, payload: DeletePayload):
     try:
-        filter_expr = dict_to_sql_filter(payload.filter)
+        filter_expr, filter_params = dict_to_sql_filter(payload.filter)
         query = f"DELETE FROM {full_table_name} WHERE {filter_expr}"
-        spark.sql(query)
+        await run_db(spark.sql, query, filter_params)
         return {"status": "deleted", "where": payload.filter}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -123,7 +168,7 @@ def delete_rows(full_table_name: str, payload: DeletePayload):
 @app.post("/tables/create", 
     summary="Create New Table",
     description="Creates a new table with the specified schema. Provide table name, column definitions, and optional properties.")
-def create_table(payload: CreateTablePayload):
+async def create_table(payload: CreateTablePayload):
     try:
         # Build CREATE TABLE statement
         columns_def = ", ".join([f"{col.name} {col.type}{' NOT NULL' if not col.nullable else ''}" + 
@@ -141,7 +186,7 @@ def create_table(payload: CreateTablePayload):
             query += f" PARTITIONED BY ({partition_cols})"
         
         # Execute the query
-        spark.sql(query)
+        await run_db(spark.sql, query)
         return {"status": "created", "table": payload.table_name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -149,10 +194,10 @@ def create_table(payload: CreateTablePayload):
 @app.delete("/tables/drop/{full_table_name}", 
     summary="Drop Table",
     description="Permanently deletes the specified table. Use with caution as this operation cannot be undone.")
-def drop_table(full_table_name: str):
+async def drop_table(full_table_name: str):
     try:
         query = f"DROP TABLE {full_table_name}"
-        spark.sql(query)
+        await run_db(spark.sql, query)
         return {"status": "dropped", "table": full_table_name}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
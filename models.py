@@ -5,26 +5,26 @@ class InsertPayload(BaseModel):
     data: List[Dict[str, Any]] = Field(
         ...,
         description="Array of objects where each object represents a row to insert. Keys are column names, values are the data to insert.",
-        example=[{"column1": "value1", "column2": 123}]
+        examples=[[{"column1": "value1", "column2": 123}]]
     )
 
 class UpdatePayload(BaseModel):
     filter: Dict[str, Any] = Field(
         ...,
         description="Filter criteria to identify which rows to update. Keys are column names, values are the values to match.",
-        example={"id": 123}
+        examples=[{"id": 123}]
     )
     updates: Dict[str, Any] = Field(
         ...,
         description="Values to update. Keys are column names, values are the new values to set.",
-        example={"status": "completed", "updated_at": "2023-01-01"}
+        examples=[{"status": "completed", "updated_at": "2023-01-01"}]
     )
 
 class DeletePayload(BaseModel):
     filter: Dict[str, Any] = Field(
         ...,
         description="Filter criteria to identify which rows to delete. Keys are column names, values are the values to match.",
-        example={"id": 123}
+        examples=[{"id": 123}]
     )
 
 class ColumnDefinition(BaseModel):
@@ -37,7 +37,7 @@ class CreateTablePayload(BaseModel):
     table_name: str = Field(
         ..., 
         description="Full table name in the format 'catalog.schema.table'",
-        example="my_catalog.my_schema.my_table"
+        examples=["my_catalog.my_schema.my_table"]
     )
     columns: List[ColumnDefinition] = Field(
         ...,
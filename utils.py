@@ -1,7 +1,40 @@
+import base64
+from datetime import timedelta
+from decimal import Decimal
+import orjson
+
 def apply_filter(df, filter_dict):
     for k, v in filter_dict.items():
         df = df.filter(f"{k} == '{v}'")
     return df
 
 def dict_to_sql_filter(filter_dict):
-    return " AND ".join([f"{k} = '{v}'" for k, v in filter_dict.items()])
+    """Build a WHERE expression with ? markers and the values to bind to them"""
+    conditions = []
+    params = []
+    for k, v in filter_dict.items():
+        if v is None:
+            conditions.append(f"{k} IS NULL")
+        else:
+            conditions.append(f"{k} = ?")
+            params.append(v)
+    return " AND ".join(conditions), params
+
+def _json_default(obj):
+    """Serialize values orjson does not handle natively"""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, timedelta):
+        return obj.total_seconds()
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+def rows_to_json(rows):
+    """Serialize a list of row dicts to JSON bytes"""
+    return orjson.dumps(rows, default=_json_default, option=orjson.OPT_NON_STR_KEYS)
+
+def arrow_to_ndjson(table):
+    """Yield an Arrow table as newline-delimited JSON, one record batch at a time"""
+    for batch in table.to_batches():
+        yield b"".join(rows_to_json(row) + b"\n" for row in batch.to_pylist())